@@ -4,12 +4,28 @@ import time
 import datetime
 import json
 from datetime import timedelta
-from flask import Flask, request, jsonify, render_template, send_from_directory, redirect, url_for, flash
+from flask import Flask, request, jsonify, render_template, send_from_directory, redirect, url_for, flash, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.utils import secure_filename
 import requests
 import re # For template parsing
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlencode
+import cProfile
+import traceback
+import gzip
+import bisect
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import hashlib
+import shutil
+import tempfile
+import struct
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import io
+import click
+from collections import Counter
+from sqlalchemy import event
 
 # --- Configuration ---
 app = Flask(__name__)
@@ -27,6 +43,40 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100 Megabytes total limit
 MAX_FILE_SIZE_MB = 10 # Individual file size limit
 
+# Media validation limits (checked before anything is uploaded to Facebook)
+MAX_VIDEO_SIZE_MB = 1024
+MAX_VIDEO_DURATION_SECONDS = 240 * 60
+MAX_IMAGE_DIMENSION = 10000
+FB_IMAGE_MIME_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/tiff'}
+FB_VIDEO_MIME_TYPES = {'video/mp4', 'video/quicktime'} # Other video containers get flagged for transcoding
+
+# Slots are interpreted in each page's own timezone; pages without one use this
+DEFAULT_TIMEZONE = os.environ.get('DEFAULT_TIMEZONE', 'UTC')
+
+# Instrumentation (opt-in): per-request SQL/HTTP timing, slow query log, sampled profiles
+app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '0') == '1'
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', '100'))
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))  # 0.0 - 1.0
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+
+# Retention: terminal posts ('posted'/'failed') older than this move out of the live table
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', '7'))
+app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+app.config['ARCHIVE_INTERVAL_MINUTES'] = int(os.environ.get('ARCHIVE_INTERVAL_MINUTES', '60'))
+app.config['ARCHIVE_TARGET'] = os.environ.get('ARCHIVE_TARGET', 'table')  # 'table' or 'jsonl'
+app.config['ARCHIVE_DIR'] = os.environ.get('ARCHIVE_DIR', 'archive')
+app.config['VACUUM_INTERVAL_HOURS'] = int(os.environ.get('VACUUM_INTERVAL_HOURS', '24'))
+
+# Worker: bound how much of a backlog one tick claims (pages share it round-robin)
+app.config['WORKER_MAX_POSTS_PER_TICK'] = int(os.environ.get('WORKER_MAX_POSTS_PER_TICK', '50'))
+app.config['WORKER_CHUNK_SIZE'] = int(os.environ.get('WORKER_CHUNK_SIZE', '10'))
+
+# Reconciliation: periodically re-check page tokens and whether posted items still exist on Facebook
+app.config['RECONCILE_INTERVAL_MINUTES'] = int(os.environ.get('RECONCILE_INTERVAL_MINUTES', '30'))
+app.config['RECONCILE_MAX_POSTS'] = int(os.environ.get('RECONCILE_MAX_POSTS', '500'))
+# Optional app access token ('app_id|app_secret') for Graph batch calls; otherwise a page token is used
+app.config['FB_APP_ACCESS_TOKEN'] = os.environ.get('FB_APP_ACCESS_TOKEN')
+
 db = SQLAlchemy(app)
 
 # --- Database Models ---
@@ -40,11 +90,21 @@ class Page(db.Model):
     
     # Scheduling settings (13 time slots)
     time_slots = db.Column(db.String(500), default='08:00,09:00,10:00,11:00,12:00,13:00,14:00,15:00,16:00,17:00,18:00,19:00,20:00')
+    # IANA timezone the slots are expressed in, e.g. 'Asia/Kolkata'
+    timezone = db.Column(db.String(64), default=DEFAULT_TIMEZONE)
+    # Optional JSON: {"weekdays": {"sat": "10:00,16:00", "sun": ""}, "blackout_dates": ["2026-12-25"]}
+    # Weekdays not listed fall back to time_slots.
+    slot_rules = db.Column(db.Text, nullable=True)
     
     # Content restrictions
     allow_images = db.Column(db.Boolean, default=True)
     allow_videos = db.Column(db.Boolean, default=True)
 
+    # Last token check result, refreshed by GET /api/pages and the reconciliation job
+    is_valid = db.Column(db.Boolean, nullable=True)
+    token_error = db.Column(db.String(255), nullable=True)
+    token_checked_at = db.Column(db.Integer, nullable=True) # UNIX timestamp
+
 class MediaFolder(db.Model):
     """Organizes media files into user-defined folders."""
     id = db.Column(db.Integer, primary_key=True)
@@ -57,6 +117,17 @@ class MediaFile(db.Model):
     original_name = db.Column(db.String(255))
     file_type = db.Column(db.String(50)) # e.g., 'image/jpeg', 'video/mp4'
     upload_date = db.Column(db.DateTime, default=datetime.datetime.now)
+
+    # Filled in by the probe pipeline. probe_status: 'pending', 'ok', 'invalid', 'error'
+    probe_status = db.Column(db.String(10), default='pending')
+    mime_type = db.Column(db.String(50), nullable=True) # Sniffed from the file contents
+    file_size = db.Column(db.Integer, nullable=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    duration_seconds = db.Column(db.Float, nullable=True)
+    checksum = db.Column(db.String(64), nullable=True) # sha256
+    needs_transcode = db.Column(db.Boolean, default=False)
+    probe_error = db.Column(db.Text, nullable=True)
     
     # Link to folder
     folder_id = db.Column(db.Integer, db.ForeignKey('media_folder.id'), nullable=True)
@@ -85,14 +156,61 @@ class ScheduledPost(db.Model):
     
     fb_post_id = db.Column(db.String(100), nullable=True)
     error_message = db.Column(db.Text, nullable=True)
+    # Set by reconciliation: False once Facebook reports the post was removed
+    fb_exists = db.Column(db.Boolean, nullable=True)
+    fb_checked_at = db.Column(db.Integer, nullable=True) # UNIX timestamp
+
+    # Serves the worker's due-post scan and the archive job without a full table scan
+    __table_args__ = (db.Index('ix_scheduled_post_due', 'status', 'scheduled_time'),)
+
+class ArchivedPost(db.Model):
+    """Cold storage for completed posts moved out of ScheduledPost by the retention job."""
+    id = db.Column(db.Integer, primary_key=True)
+    # The post's id in ScheduledPost. Not unique: SQLite reuses rowids once the live table drains.
+    original_post_id = db.Column(db.Integer, index=True)
+    page_id = db.Column(db.Integer, index=True)
+    media_file_id = db.Column(db.Integer, nullable=True)
+    title = db.Column(db.String(255))
+    description = db.Column(db.Text)
+    scheduled_time = db.Column(db.Integer)
+    media_type = db.Column(db.String(10))
+    status = db.Column(db.String(10))
+    fb_post_id = db.Column(db.String(100), nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    archived_at = db.Column(db.Integer) # UNIX timestamp
+
+class PostDailyStats(db.Model):
+    """Per page, per day counters of archived posts, so history survives compaction."""
+    id = db.Column(db.Integer, primary_key=True)
+    page_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.String(10), nullable=False) # 'YYYY-MM-DD'
+    posted_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    __table_args__ = (db.UniqueConstraint('page_id', 'day'),)
 
 
 # --- Initialization ---
 
+def upgrade_existing_tables():
+    """create_all() never alters existing tables, so add any model columns and indexes an older DB file lacks."""
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=db.engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}')
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
 def create_initial_db_entries():
     """Initializes the database, creating the tables and a default folder."""
     with app.app_context():
         db.create_all()
+        upgrade_existing_tables()
 
         if MediaFolder.query.count() == 0:
             default_folder = MediaFolder(name='Default Folder')
@@ -101,10 +219,345 @@ def create_initial_db_entries():
 
 create_initial_db_entries()
 
+# --- Instrumentation ---
+
+def _request_stats():
+    """Returns the stats dict for the current request, or None outside a profiled request."""
+    if has_request_context():
+        return g.get('req_stats')
+    return None
+
+def _query_call_site():
+    """Finds the innermost frame in this module that triggered a query (skipping the hooks)."""
+    this_file = os.path.abspath(__file__)
+    for frame in reversed(traceback.extract_stack()):
+        if os.path.abspath(frame.filename) == this_file and frame.name not in ('_query_call_site', '_on_after_cursor_execute'):
+            return f"{frame.name}:{frame.lineno}"
+    return 'unknown'
+
+def _on_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _on_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+    stats = _request_stats()
+    if stats is not None:
+        stats['sql_count'] += 1
+        stats['sql_ms'] += elapsed_ms
+    if elapsed_ms >= app.config['SLOW_QUERY_MS']:
+        app.logger.warning(f"Slow query ({elapsed_ms:.1f} ms) at {_query_call_site()}: {' '.join(statement.split())[:500]}")
+
+def graph_api_request(method, url, **kwargs):
+    """Thin wrapper around requests that accounts outbound HTTP time to the current request."""
+    start = time.perf_counter()
+    try:
+        return requests.request(method, url, **kwargs)
+    finally:
+        stats = _request_stats()
+        if stats is not None:
+            stats['http_count'] += 1
+            stats['http_ms'] += (time.perf_counter() - start) * 1000
+
+@app.before_request
+def _start_request_stats():
+    if not app.config['PROFILING_ENABLED']:
+        return
+    g.req_stats = {'sql_count': 0, 'sql_ms': 0.0, 'http_count': 0, 'http_ms': 0.0, 'start': time.perf_counter()}
+    if random.random() < app.config['PROFILE_SAMPLE_RATE']:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows only one active profiler per process; skip sampling this request.
+            return
+        g.profiler = profiler
+
+@app.after_request
+def _finish_request_stats(response):
+    stats = _request_stats()
+    if stats is None:
+        return response
+
+    total_ms = (time.perf_counter() - stats['start']) * 1000
+    profiler = g.pop('profiler', None)
+    if profiler:
+        profiler.disable()
+        os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+        endpoint = (request.endpoint or 'unknown').replace('.', '_')
+        profile_path = os.path.join(app.config['PROFILE_DIR'], f"{int(time.time() * 1000)}_{endpoint}.prof")
+        profiler.dump_stats(profile_path)
+        app.logger.info(f"Profile for {request.method} {request.path} written to {profile_path}")
+
+    response.headers['Server-Timing'] = (
+        f"sql;desc=\"{stats['sql_count']} queries\";dur={stats['sql_ms']:.1f}, "
+        f"http;desc=\"{stats['http_count']} calls\";dur={stats['http_ms']:.1f}, "
+        f"total;dur={total_ms:.1f}"
+    )
+    app.logger.info(
+        f"{request.method} {request.path} {response.status_code}: total={total_ms:.1f}ms "
+        f"sql={stats['sql_count']}q/{stats['sql_ms']:.1f}ms http={stats['http_count']}/{stats['http_ms']:.1f}ms"
+    )
+    return response
+
+if app.config['PROFILING_ENABLED']:
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _on_before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _on_after_cursor_execute)
+
+# --- Media Probing ---
+
+probe_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='media-probe')
+_probes_in_flight = set()
+
+def _sniff_mime_type(header):
+    """Identifies the container from the first bytes of the file."""
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if header.startswith(b'BM'):
+        return 'image/bmp'
+    if header[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'image/tiff'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    if header[:4] == b'RIFF' and header[8:12] == b'AVI ':
+        return 'video/x-msvideo'
+    if header[4:8] == b'ftyp':
+        # ISO-BMFF is shared by MP4/MOV video, HEIF/AVIF stills and M4A audio: go by the major brand
+        brand = header[8:12]
+        if brand in (b'avif', b'avis') or (brand == b'mif1' and b'avif' in header[16:32]):
+            return 'image/avif'
+        if brand in (b'heic', b'heix', b'hevc', b'hevx', b'mif1', b'msf1'):
+            return 'image/heic'
+        if brand in (b'M4A ', b'M4B ', b'M4P '):
+            return 'audio/mp4'
+        return 'video/quicktime' if brand == b'qt  ' else 'video/mp4'
+    if header.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video/webm'
+    return None
+
+def _image_dimensions(f, mime_type):
+    """Reads width/height from the image header without decoding it."""
+    f.seek(0)
+    head = f.read(32)
+    if mime_type == 'image/png':
+        return struct.unpack('>II', head[16:24])
+    if mime_type == 'image/tiff':
+        # First IFD: ImageWidth (256) and ImageLength (257), stored as SHORT or LONG
+        order = '<' if head[:2] == b'II' else '>'
+        f.seek(struct.unpack(order + 'I', head[4:8])[0])
+        dims = {}
+        for _ in range(struct.unpack(order + 'H', f.read(2))[0]):
+            tag, field_type, _count, value = struct.unpack(order + 'HHI4s', f.read(12))
+            if tag in (256, 257):
+                dims[tag] = struct.unpack(order + ('H' if field_type == 3 else 'I'), value[:2 if field_type == 3 else 4])[0]
+        return (dims[256], dims[257]) if len(dims) == 2 else None
+    if mime_type == 'image/gif':
+        return struct.unpack('<HH', head[6:10])
+    if mime_type == 'image/bmp':
+        w, h = struct.unpack('<ii', head[18:26])
+        return w, abs(h)
+    if mime_type == 'image/webp':
+        chunk = head[12:16]
+        if chunk == b'VP8X':
+            return (int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1)
+        f.seek(20)
+        data = f.read(10)
+        if chunk == b'VP8 ':
+            w, h = struct.unpack('<HH', data[6:10])
+            return w & 0x3fff, h & 0x3fff
+        if chunk == b'VP8L':
+            bits = int.from_bytes(data[1:5], 'little')
+            return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if mime_type == 'image/jpeg':
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xff:
+                return None
+            if marker[1] in (0xd8, 0x01) or 0xd0 <= marker[1] <= 0xd7:
+                continue
+            if marker[1] in (0xd9, 0xda):
+                # End of image, or start of scan data, before any frame header
+                return None
+            length = struct.unpack('>H', f.read(2))[0]
+            # SOF0-SOF15, excluding DHT (c4), JPG (c8) and DAC (cc)
+            if 0xc0 <= marker[1] <= 0xcf and marker[1] not in (0xc4, 0xc8, 0xcc):
+                h, w = struct.unpack('>xHH', f.read(5))
+                return w, h
+            f.seek(length - 2, os.SEEK_CUR)
+    return None
+
+def _iter_mp4_boxes(f, start, end):
+    """Yields (type, payload_offset, payload_end) for ISO-BMFF boxes between start and end."""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+def _mp4_metadata(f, file_size):
+    """Reads duration (mvhd) and the first visual track size (tkhd) from an MP4/MOV file."""
+    duration = width = height = None
+    for box_type, start, end in _iter_mp4_boxes(f, 0, file_size):
+        if box_type != b'moov':
+            continue
+        for child, c_start, c_end in _iter_mp4_boxes(f, start, end):
+            if child == b'mvhd':
+                f.seek(c_start)
+                version = f.read(4)[0]
+                if version == 1:
+                    timescale, length = struct.unpack('>16xIQ', f.read(28))
+                else:
+                    timescale, length = struct.unpack('>8xII', f.read(16))
+                if timescale:
+                    duration = length / timescale
+            elif child == b'trak' and width is None:
+                for grandchild, g_start, g_end in _iter_mp4_boxes(f, c_start, c_end):
+                    if grandchild == b'tkhd':
+                        # Track width/height are 16.16 fixed point in the last 8 bytes
+                        f.seek(g_end - 8)
+                        w, h = struct.unpack('>II', f.read(8))
+                        if w and h:
+                            width, height = w >> 16, h >> 16
+        break
+    return duration, width, height
+
+def _ffprobe_metadata(file_path):
+    """Uses ffprobe when the image has it installed; returns (duration, width, height) or None."""
+    if not shutil.which('ffprobe'):
+        return None
+    try:
+        out = subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+             'stream=width,height:format=duration', '-of', 'json', file_path],
+            capture_output=True, timeout=30, check=True
+        ).stdout
+        info = json.loads(out)
+        stream = (info.get('streams') or [{}])[0]
+        duration = info.get('format', {}).get('duration')
+        return (float(duration) if duration else None), stream.get('width'), stream.get('height')
+    except (subprocess.SubprocessError, ValueError, OSError):
+        return None
+
+def validate_media(media):
+    """Returns a reason string if the probed media can't be published to Facebook, else None."""
+    if not media.mime_type:
+        return 'Unrecognised or corrupt media file.'
+    if media.mime_type.startswith('video/'):
+        if media.file_size > MAX_VIDEO_SIZE_MB * 1024 * 1024:
+            return f'Video exceeds {MAX_VIDEO_SIZE_MB} MB.'
+        if media.duration_seconds is not None and media.duration_seconds > MAX_VIDEO_DURATION_SECONDS:
+            return f'Video longer than {MAX_VIDEO_DURATION_SECONDS // 60} minutes.'
+        if media.duration_seconds == 0:
+            return 'Video has no playable duration.'
+        return None
+    if not media.mime_type.startswith('image/'):
+        return f'Unsupported media type: {media.mime_type}.'
+    if media.file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
+        return f'Image exceeds {MAX_FILE_SIZE_MB} MB.'
+    if media.mime_type not in FB_IMAGE_MIME_TYPES:
+        return None # Flagged needs_transcode; dimensions are checked after conversion
+    if media.width is None or media.height is None:
+        return 'Could not read image dimensions (corrupt file?).'
+    if max(media.width, media.height) > MAX_IMAGE_DIMENSION:
+        return f'Image larger than {MAX_IMAGE_DIMENSION}px on one side.'
+    return None
+
+def probe_media(media):
+    """Inspects the stored file once and records real type, size, dimensions, duration and checksum."""
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], media.filename)
+    try:
+        file_size = os.path.getsize(file_path)
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            header = f.read(32)
+            f.seek(0)
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+
+            media.file_size = file_size
+            media.checksum = sha256.hexdigest()
+            media.mime_type = _sniff_mime_type(header)
+            media.width = media.height = media.duration_seconds = None
+
+            if media.mime_type and media.mime_type.startswith('image/'):
+                dims = _image_dimensions(f, media.mime_type)
+                if dims:
+                    media.width, media.height = dims
+            elif media.mime_type:
+                meta = _ffprobe_metadata(file_path)
+                if meta is None and media.mime_type in FB_VIDEO_MIME_TYPES:
+                    meta = _mp4_metadata(f, file_size)
+                if meta:
+                    media.duration_seconds, media.width, media.height = meta
+
+        media.needs_transcode = bool(media.mime_type) and media.mime_type not in FB_IMAGE_MIME_TYPES | FB_VIDEO_MIME_TYPES
+        media.probe_error = validate_media(media)
+        media.probe_status = 'invalid' if media.probe_error else 'ok'
+    except (OSError, struct.error, IndexError) as e:
+        media.probe_status = 'error'
+        media.probe_error = f'Probe failed: {e}'
+    return media.probe_status
+
+def queue_media_probe(media_id):
+    if media_id not in _probes_in_flight:
+        _probes_in_flight.add(media_id)
+        probe_executor.submit(_probe_media_task, media_id)
+
+def _probe_media_task(media_id):
+    try:
+        with app.app_context():
+            media = MediaFile.query.get(media_id)
+            if media is None or media.probe_status not in (None, 'pending'):
+                return
+            probe_media(media)
+            db.session.commit()
+    except Exception as e:
+        app.logger.error(f"Media probe for ID {media_id} failed: {e}")
+    finally:
+        _probes_in_flight.discard(media_id)
+
+def probe_pending_media(limit=20):
+    """Queues files uploaded before the pipeline existed, or whose probe was lost on restart."""
+    pending_ids = [row[0] for row in db.session.query(MediaFile.id).filter(
+        db.or_(MediaFile.probe_status == 'pending', MediaFile.probe_status.is_(None))
+    ).limit(limit)]
+    for media_id in pending_ids:
+        queue_media_probe(media_id)
+    return len(pending_ids)
+
+def media_rejection_reason(media):
+    """Why this media must not be sent to Facebook, or None. Unprobed media is given the benefit of the doubt."""
+    if media.probe_status in ('invalid', 'error'):
+        return media.probe_error
+    if media.needs_transcode:
+        return f'{media.mime_type} must be transcoded before publishing.'
+    return None
+
+def media_is_video(media):
+    """Prefers the sniffed type; falls back to the client-supplied content type until probed."""
+    return 'video' in (media.mime_type or media.file_type or '').lower()
+
+
 # --- Worker & Helper Functions ---
 
 def generate_post_content(title_template, description_template):
     """Generates dynamic content using [HH:MM] and [RND3]."""
+    if '[' not in title_template:
+        return title_template, description_template
     now = datetime.datetime.now()
     hour_minute = now.strftime("%H:%M")
     random_3_digit = str(random.randint(100, 999))
@@ -112,38 +565,6 @@ def generate_post_content(title_template, description_template):
     description = description_template
     return title, description
 
-def get_next_available_slot(page_id, time_slots_str, start_dt):
-    """Finds the next unique time slot for scheduling."""
-    time_slots = sorted([ts.strip() for ts in time_slots_str.split(',') if ts.strip()])
-    if not time_slots: return None
-    start_dt += timedelta(minutes=1)
-    current_dt = start_dt.replace(second=0, microsecond=0)
-    search_limit = current_dt + timedelta(days=7)
-    
-    while current_dt < search_limit:
-        time_slot_str = current_dt.strftime("%H:%M")
-        
-        if time_slot_str in time_slots:
-            scheduled_unix = int(current_dt.timestamp())
-            existing_post = ScheduledPost.query.filter(
-                ScheduledPost.page_id == page_id,
-                ScheduledPost.scheduled_time == scheduled_unix,
-                ScheduledPost.status != 'failed'
-            ).first()
-
-            if not existing_post:
-                return current_dt
-        
-        current_dt += timedelta(minutes=1)
-
-        if current_dt.minute == 0:
-            if current_dt.hour == 0:
-                h, m = map(int, time_slots[0].split(':'))
-                current_dt = current_dt.replace(hour=h, minute=m, day=current_dt.day + 1)
-            else:
-                pass
-    return None
-
 def check_token_and_get_page_info(page_id, access_token):
     """Checks token validity against FB API and fetches page name."""
     if not page_id or not access_token:
@@ -153,7 +574,7 @@ def check_token_and_get_page_info(page_id, access_token):
     params = {'fields': 'name', 'access_token': access_token}
     
     try:
-        response = requests.get(GRAPH_API_URL, params=params, timeout=5) 
+        response = graph_api_request('GET', GRAPH_API_URL, params=params, timeout=5)
         response.raise_for_status()
         data = response.json()
         
@@ -191,7 +612,18 @@ def post_to_facebook(post_id, publish_now=False):
         app.logger.error(f"Worker Error: Media file not found on disk: {file_path}")
         return False, "Media file missing from server disk."
     
-    is_video = 'video' in media.file_type.lower()
+    if media.probe_status in (None, 'pending'):
+        probe_media(media)
+        db.session.commit()
+    reason = media_rejection_reason(media)
+    if reason:
+        app.logger.error(f"Worker Error: Post ID {post_id} rejected before upload: {reason}")
+        post.status = 'failed'
+        post.error_message = f'Media rejected: {reason}'
+        db.session.commit()
+        return False, post.error_message
+
+    is_video = media_is_video(media)
     
     # Setup API Edge
     if is_video:
@@ -236,9 +668,9 @@ def post_to_facebook(post_id, publish_now=False):
     
     try:
         with open(file_path, 'rb') as f:
-            files = {'source': (media.filename, f, media.file_type)}
+            files = {'source': (media.filename, f, media.mime_type or media.file_type)}
             
-            response = requests.post(GRAPH_API_URL, data=data_params, files=files, timeout=60) 
+            response = graph_api_request('POST', GRAPH_API_URL, data=data_params, files=files, timeout=60)
             response_json = response.json()
             
             if 'id' in response_json:
@@ -263,6 +695,762 @@ def post_to_facebook(post_id, publish_now=False):
         return False, error_message
 
 
+# --- Slot Calendar ---
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+SLOT_CALENDAR_DAYS = 60
+
+# page.id -> {'key': settings the calendar was built from, 'start': first local day, 'slots': sorted unix timestamps}
+_slot_calendars = {}
+
+def parse_time_slots(time_slots):
+    """Parses 'HH:MM,HH:MM' (or a list of them) into sorted (hour, minute) tuples. Raises ValueError on bad entries."""
+    if isinstance(time_slots, str):
+        time_slots = time_slots.split(',')
+    elif time_slots is not None and not isinstance(time_slots, (list, tuple)):
+        raise ValueError('Time slots must be a "HH:MM,HH:MM" string or a list of "HH:MM" strings.')
+    parsed_slots = set()
+    for ts in time_slots or []:
+        if not isinstance(ts, str):
+            raise ValueError(f'Invalid time slot: {ts!r}')
+        ts = ts.strip()
+        if not ts:
+            continue
+        h, m = map(int, ts.split(':'))
+        if not (0 <= h < 24 and 0 <= m < 60):
+            raise ValueError(f'Invalid time slot: {ts}')
+        parsed_slots.add((h, m))
+    return sorted(parsed_slots)
+
+def parse_slot_rules(slot_rules):
+    """Validates slot_rules (JSON string or dict) into {'weekdays': {idx: [(h, m)]}, 'blackout_dates': set}."""
+    if not slot_rules:
+        return {'weekdays': {}, 'blackout_dates': set()}
+    rules = json.loads(slot_rules) if isinstance(slot_rules, str) else slot_rules
+    if not isinstance(rules, dict):
+        raise ValueError('Slot rules must be an object with "weekdays" and/or "blackout_dates".')
+
+    weekdays = {}
+    weekday_rules = rules.get('weekdays') or {}
+    if not isinstance(weekday_rules, dict):
+        raise ValueError('"weekdays" must map weekday names to time slots.')
+    for day, slots in weekday_rules.items():
+        if day.lower()[:3] not in WEEKDAYS:
+            raise ValueError(f'Unknown weekday: {day}')
+        weekdays[WEEKDAYS.index(day.lower()[:3])] = parse_time_slots(slots)
+
+    blackout_rules = rules.get('blackout_dates') or []
+    if not isinstance(blackout_rules, list) or not all(isinstance(d, str) for d in blackout_rules):
+        raise ValueError('"blackout_dates" must be a list of "YYYY-MM-DD" strings.')
+    blackout_dates = {datetime.date.fromisoformat(d) for d in blackout_rules}
+    return {'weekdays': weekdays, 'blackout_dates': blackout_dates}
+
+def get_page_timezone(page):
+    try:
+        return ZoneInfo(page.timezone or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        app.logger.error(f"Page {page.id}: unknown timezone '{page.timezone}', using {DEFAULT_TIMEZONE}.")
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+def _build_slot_calendar(page, start_day, tz):
+    """Expands the page's slot definitions into sorted unix timestamps for SLOT_CALENDAR_DAYS local days."""
+    try:
+        default_slots = parse_time_slots(page.time_slots)
+        rules = parse_slot_rules(page.slot_rules)
+    except (ValueError, TypeError, AttributeError) as e:
+        app.logger.error(f"Page {page.id}: invalid slot settings ({e}), no slots available.")
+        return []
+
+    slots = set()
+    for offset in range(SLOT_CALENDAR_DAYS):
+        day = start_day + timedelta(days=offset)
+        if day in rules['blackout_dates']:
+            continue
+        for h, m in rules['weekdays'].get(day.weekday(), default_slots):
+            local_dt = datetime.datetime(day.year, day.month, day.day, h, m, tzinfo=tz)
+            utc_dt = local_dt.astimezone(datetime.timezone.utc)
+            # Skip wall times that don't exist (DST spring-forward gap). For repeated
+            # wall times (fall-back) fold=0 keeps only the first occurrence.
+            if utc_dt.astimezone(tz).replace(tzinfo=None) != local_dt.replace(tzinfo=None):
+                continue
+            slots.add(int(utc_dt.timestamp()))
+    return sorted(slots)
+
+def get_slot_calendar(page):
+    """Returns the page's cached slot calendar (sorted unix timestamps), rebuilding it when settings or the day change."""
+    tz = get_page_timezone(page)
+    today = datetime.datetime.now(tz).date()
+    key = (page.timezone, page.time_slots, page.slot_rules)
+
+    cached = _slot_calendars.get(page.id)
+    if cached is None or cached['key'] != key or cached['start'] != today:
+        cached = {'key': key, 'start': today, 'slots': _build_slot_calendar(page, today, tz)}
+        _slot_calendars[page.id] = cached
+    return cached['slots']
+
+def slots_between(page, start_ts, end_ts):
+    """Calendar slots with start_ts < slot <= end_ts, found by bisection."""
+    calendar = get_slot_calendar(page)
+    return calendar[bisect.bisect_right(calendar, start_ts):bisect.bisect_right(calendar, end_ts)]
+
+def is_valid_slot(page, ts):
+    calendar = get_slot_calendar(page)
+    i = bisect.bisect_left(calendar, ts)
+    return i < len(calendar) and calendar[i] == ts
+
+def apply_page_schedule_settings(page, data):
+    """Validates and applies 'timezone', 'timeSlots' and 'slotRules' from a request body. Raises ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object.')
+    if 'timezone' in data:
+        if not isinstance(data['timezone'], str):
+            raise ValueError(f"Unknown timezone: {data['timezone']}")
+        try:
+            ZoneInfo(data['timezone'])
+        except (ZoneInfoNotFoundError, ValueError, TypeError):
+            raise ValueError(f"Unknown timezone: {data['timezone']}")
+        page.timezone = data['timezone']
+    if 'timeSlots' in data:
+        slots = parse_time_slots(data['timeSlots'])
+        page.time_slots = ','.join(f'{h:02d}:{m:02d}' for h, m in slots)
+    if 'slotRules' in data:
+        if data['slotRules']:
+            parse_slot_rules(data['slotRules'])
+            page.slot_rules = data['slotRules'] if isinstance(data['slotRules'], str) else json.dumps(data['slotRules'])
+        else:
+            page.slot_rules = None
+
+def get_free_slots(page, start_dt, end_dt):
+    """Returns every slot of the page in (start_dt, end_dt] that is not already taken, using one query."""
+    start_ts, end_ts = int(start_dt.timestamp()), int(end_dt.timestamp())
+    candidates = slots_between(page, start_ts, end_ts)
+    if not candidates:
+        return []
+
+    taken = {row[0] for row in db.session.query(ScheduledPost.scheduled_time).filter(
+        ScheduledPost.page_id == page.id,
+        ScheduledPost.status != 'failed',
+        ScheduledPost.scheduled_time > start_ts,
+        ScheduledPost.scheduled_time <= end_ts
+    )}
+    tz = get_page_timezone(page)
+    return [datetime.datetime.fromtimestamp(ts, tz) for ts in candidates if ts not in taken]
+
+
+# --- Campaign Planner ---
+
+PLANNER_HORIZON_DAYS = SLOT_CALENDAR_DAYS
+
+def plan_campaign(media_files, pages, strategy='round_robin', horizon_days=PLANNER_HORIZON_DAYS, start_dt=None):
+    """
+    Assigns every allowed (page, media) pair a slot from that page's own free capacity.
+    'round_robin' packs each page's earliest free slots, rotating the media order per page so
+    the same file doesn't go out on every page at once. 'even' spreads each page's posts
+    evenly over its free slots in the horizon.
+    Returns (plan, unscheduled): plan is a time-ordered list of (page, media, slot_dt).
+    """
+    start_dt = (start_dt or datetime.datetime.now(datetime.timezone.utc)).replace(second=0, microsecond=0)
+    end_dt = start_dt + timedelta(days=horizon_days)
+
+    plan = []
+    unscheduled = []
+    for index, page in enumerate(pages):
+        page_media = [
+            media for media in media_files
+            if (page.allow_videos if media_is_video(media) else page.allow_images)
+        ]
+        if not page_media:
+            continue
+        if strategy == 'round_robin':
+            offset = index % len(page_media)
+            page_media = page_media[offset:] + page_media[:offset]
+
+        free_slots = get_free_slots(page, start_dt, end_dt)
+        needed = min(len(page_media), len(free_slots))
+        if strategy == 'even' and needed:
+            stride = len(free_slots) / needed
+            slots = [free_slots[int(i * stride)] for i in range(needed)]
+        else:
+            slots = free_slots[:needed]
+
+        plan.extend((page, media, slot) for media, slot in zip(page_media, slots))
+        unscheduled.extend(
+            {'page_id': page.id, 'page_name': page.page_name, 'media_id': media.id, 'media_name': media.original_name}
+            for media in page_media[needed:]
+        )
+
+    plan.sort(key=lambda item: (item[2], item[0].id))
+    return plan, unscheduled
+
+
+# --- Bulk Import ---
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 1000
+NEXT_SLOT_VALUES = ('', 'next', 'next slot', 'next_slot')
+
+def _iter_import_rows(stream, fmt):
+    """Yields (row_number, dict) from a binary JSONL or CSV stream, one row at a time."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        for row_number, row in enumerate(csv.DictReader(text), start=2):
+            yield row_number, {(k or '').strip().lower(): v for k, v in row.items()}
+        return
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f'Invalid JSON: {e}')
+            continue
+        yield row_number, row if isinstance(row, dict) else ValueError('Row must be a JSON object.')
+
+class _ImportLookups:
+    """Pages and media resolved once up front, so validating a row never touches the database."""
+
+    def __init__(self):
+        self.pages = {}
+        for page in Page.query.all():
+            for key in (str(page.id), page.page_id, page.page_name):
+                self.pages.setdefault(key, page)
+
+        self.media = {}
+        media_rows = db.session.query(
+            MediaFile.id, MediaFile.filename, MediaFile.original_name, MediaFile.file_type, MediaFile.mime_type,
+            MediaFile.probe_status, MediaFile.probe_error, MediaFile.needs_transcode
+        )
+        for row in media_rows:
+            for key in (str(row.id), row.filename, row.original_name):
+                self.media.setdefault(key, row)
+
+        self.free_slots = {} # page.id -> iterator over calendar slot timestamps
+        self.taken = {}      # page.id -> booked timestamps: existing posts plus rows of this import
+        self.targets = {}    # (page key, media key) -> (page, media id, media type) or the ValueError
+
+    def taken_for(self, page):
+        """Slots already booked on the page, loaded from the database on first use."""
+        if page.id not in self.taken:
+            now_unix = int(time.time())
+            self.taken[page.id] = {row[0] for row in db.session.query(ScheduledPost.scheduled_time).filter(
+                ScheduledPost.page_id == page.id,
+                ScheduledPost.status != 'failed',
+                ScheduledPost.scheduled_time > now_unix,
+                ScheduledPost.scheduled_time <= now_unix + SLOT_CALENDAR_DAYS * 86400
+            )}
+        return self.taken[page.id]
+
+    def next_slot(self, page):
+        if page.id not in self.free_slots:
+            now_unix = int(time.time())
+            self.free_slots[page.id] = iter(slots_between(page, now_unix, now_unix + SLOT_CALENDAR_DAYS * 86400))
+        taken = self.taken_for(page)
+        for ts in self.free_slots[page.id]:
+            if ts not in taken:
+                return ts
+        return None
+
+def _parse_import_time(value, page, lookups):
+    """Resolves a row's time to a free slot of the page. Raises ValueError with the reason."""
+    value = '' if value is None else str(value).strip()
+    if value.lower() in NEXT_SLOT_VALUES:
+        ts = lookups.next_slot(page)
+        if ts is None:
+            raise ValueError(f'No free slot left for page {page.page_name} within {SLOT_CALENDAR_DAYS} days.')
+        return ts
+    if value.isdigit():
+        ts = int(value)
+    else:
+        dt = datetime.datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=get_page_timezone(page))
+        ts = int(dt.timestamp())
+    if ts <= int(time.time()):
+        raise ValueError(f'Time {value} is in the past.')
+    # Explicit times follow the same rules as 'next slot': one of the page's slots, and not already booked
+    if not is_valid_slot(page, ts):
+        raise ValueError(f'Time {value} is not one of the slots of page {page.page_name} within {SLOT_CALENDAR_DAYS} days.')
+    if ts in lookups.taken_for(page):
+        raise ValueError(f'Time {value} is already booked on page {page.page_name}.')
+    return ts
+
+def _resolve_import_target(page_key, media_key, lookups):
+    """Resolves and validates a (page, media) pair. Raises ValueError with the reason."""
+    page = lookups.pages.get(page_key)
+    if page is None:
+        raise ValueError(f"Unknown page: {page_key!r}")
+    media = lookups.media.get(media_key)
+    if media is None:
+        raise ValueError(f"Unknown media: {media_key!r}")
+
+    reason = media_rejection_reason(media)
+    if reason:
+        raise ValueError(f'Media rejected: {reason}')
+    is_video = media_is_video(media)
+    if is_video and not page.allow_videos:
+        raise ValueError(f'Page {page.page_name}: Videos restricted.')
+    if not is_video and not page.allow_images:
+        raise ValueError(f'Page {page.page_name}: Images restricted.')
+    return page, media.id, 'video' if is_video else 'image'
+
+def _build_import_post(row, lookups):
+    """Validates one row and returns the ScheduledPost column mapping. Raises ValueError with the reason."""
+    key = (str(row.get('page', '')).strip(), str(row.get('media', '')).strip())
+    # Campaign files repeat the same few (page, media) pairs, so validate each pair once
+    target = lookups.targets.get(key)
+    if target is None:
+        try:
+            target = _resolve_import_target(*key, lookups)
+        except ValueError as e:
+            target = e
+        lookups.targets[key] = target
+    if isinstance(target, ValueError):
+        raise target
+    page, media_id, media_type = target
+
+    for field in ('title', 'description'):
+        if not isinstance(row.get(field), (str, type(None))):
+            raise ValueError(f'{field} must be text.')
+
+    scheduled_time = _parse_import_time(row.get('time'), page, lookups)
+    lookups.taken_for(page).add(scheduled_time)
+    title, description = generate_post_content(row.get('title') or '', row.get('description') or '')
+    return {
+        'page_id': page.id,
+        'media_file_id': media_id,
+        'title': title,
+        'description': description,
+        'scheduled_time': scheduled_time,
+        'media_type': media_type,
+        'status': 'scheduled',
+        'is_active': True
+    }
+
+def import_scheduled_posts(stream, fmt='jsonl', dry_run=False):
+    """
+    Streams (page, media, time, title, description) rows from a JSONL or CSV file into ScheduledPost.
+    page/media may be an internal id, FB page id / stored filename, or name. time is 'next slot', or a
+    UNIX timestamp / ISO datetime (naive means the page's timezone) that must be a free slot of the
+    page. Valid rows are inserted in IMPORT_CHUNK_SIZE transactions; invalid rows are reported and
+    skipped. If a chunk fails to insert, the import stops and summary['aborted'] says where;
+    imported_count still counts the chunks committed before it.
+    """
+    lookups = _ImportLookups()
+    summary = {'imported_count': 0, 'error_count': 0, 'errors': [], 'dry_run': dry_run, 'aborted': None}
+    chunk = []
+
+    def flush(row_number):
+        if chunk and not dry_run:
+            try:
+                # Core executemany: no ORM objects are created for imported rows
+                db.session.execute(ScheduledPost.__table__.insert(), chunk)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Bulk import chunk ending at row {row_number} failed: {e}")
+                summary['aborted'] = f'Database error while inserting the chunk ending at row {row_number}; import stopped there.'
+                chunk.clear()
+                return False
+        summary['imported_count'] += len(chunk)
+        chunk.clear()
+        return True
+
+    row_number = 0
+    for row_number, row in _iter_import_rows(stream, fmt):
+        try:
+            if isinstance(row, Exception):
+                raise row
+            chunk.append(_build_import_post(row, lookups))
+        except (ValueError, TypeError) as e:
+            summary['error_count'] += 1
+            if len(summary['errors']) < IMPORT_MAX_REPORTED_ERRORS:
+                summary['errors'].append({'row': row_number, 'error': str(e)})
+            continue
+        if len(chunk) >= IMPORT_CHUNK_SIZE and not flush(row_number):
+            return summary
+    flush(row_number)
+    return summary
+
+@app.cli.command('import-posts')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default=None, help='Defaults to the file extension.')
+@click.option('--dry-run', is_flag=True, help='Validate every row without inserting anything.')
+def import_posts_command(path, fmt, dry_run):
+    """Bulk-import scheduled posts from a JSONL or CSV file."""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        summary = import_scheduled_posts(f, fmt, dry_run=dry_run)
+    for error in summary['errors']:
+        click.echo(f"row {error['row']}: {error['error']}", err=True)
+    if summary['aborted']:
+        click.echo(summary['aborted'], err=True)
+    verb = 'validated' if dry_run else 'imported'
+    click.echo(f"{summary['imported_count']} posts {verb}, {summary['error_count']} rows rejected "
+               f"in {time.perf_counter() - start:.1f}s.")
+
+
+# --- Retention & Compaction ---
+
+ARCHIVE_COLUMNS = ('id', 'page_id', 'media_file_id', 'title', 'description', 'scheduled_time',
+                   'media_type', 'status', 'fb_post_id', 'error_message')
+
+_last_archive_run = 0
+_last_vacuum_run = 0
+
+def _archive_batch(rows, archived_at):
+    """Writes one batch of terminal posts to the archive target and folds them into the daily stats."""
+    records = []
+    for row in rows:
+        record = dict(zip(ARCHIVE_COLUMNS, row), archived_at=archived_at)
+        record['original_post_id'] = record.pop('id')
+        records.append(record)
+
+    gzip_member = None
+    if app.config['ARCHIVE_TARGET'] == 'jsonl':
+        # Compressed here, but only appended by the caller once the delete has committed,
+        # so a failed commit can't leave rows both in ScheduledPost and in the archive file.
+        gzip_member = gzip.compress(''.join(json.dumps(record) + '\n' for record in records).encode('utf-8'))
+    else:
+        db.session.bulk_insert_mappings(ArchivedPost, records)
+
+    # Stats days follow each page's own timezone, like its slots
+    page_ids = {record['page_id'] for record in records}
+    timezones = {page.id: get_page_timezone(page) for page in Page.query.filter(Page.id.in_(page_ids))}
+    default_tz = ZoneInfo(DEFAULT_TIMEZONE)
+
+    counts = Counter()
+    for record in records:
+        tz = timezones.get(record['page_id'], default_tz)
+        day = datetime.datetime.fromtimestamp(record['scheduled_time'] or archived_at, tz).strftime('%Y-%m-%d')
+        counts[(record['page_id'], day, record['status'])] += 1
+
+    keys = {(page_id, day) for page_id, day, _ in counts}
+    existing = {
+        (st.page_id, st.day): st
+        for st in PostDailyStats.query.filter(PostDailyStats.page_id.in_({k[0] for k in keys}),
+                                              PostDailyStats.day.in_({k[1] for k in keys}))
+    }
+    for (page_id, day, status), n in counts.items():
+        stats = existing.get((page_id, day))
+        if stats is None:
+            stats = PostDailyStats(page_id=page_id, day=day, posted_count=0, failed_count=0)
+            db.session.add(stats)
+            existing[(page_id, day)] = stats
+        if status == 'posted':
+            stats.posted_count += n
+        else:
+            stats.failed_count += n
+
+    ScheduledPost.query.filter(ScheduledPost.id.in_([r['original_post_id'] for r in records])).delete(synchronize_session=False)
+    return gzip_member
+
+def _append_archive_member(gzip_member):
+    """Appends one batch to this month's archive; readers handle multi-member gzip files transparently."""
+    archive_path = os.path.join(app.config['ARCHIVE_DIR'], f"posts_{datetime.date.today():%Y%m}.jsonl.gz")
+    with open(archive_path, 'ab') as f:
+        f.write(gzip_member)
+        f.flush()
+        os.fsync(f.fileno())
+
+def archive_completed_posts():
+    """
+    Moves 'posted'/'failed' posts older than ARCHIVE_AFTER_DAYS out of ScheduledPost in batches.
+    Each batch is its own transaction so a large backlog never holds a long write lock.
+    """
+    cutoff = int(time.time()) - app.config['ARCHIVE_AFTER_DAYS'] * 86400
+    batch_size = app.config['ARCHIVE_BATCH_SIZE']
+    archived_count = 0
+
+    while True:
+        rows = db.session.query(*[getattr(ScheduledPost, c) for c in ARCHIVE_COLUMNS]).filter(
+            ScheduledPost.status.in_(['posted', 'failed']),
+            ScheduledPost.scheduled_time < cutoff
+        ).order_by(ScheduledPost.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        try:
+            if app.config['ARCHIVE_TARGET'] == 'jsonl':
+                os.makedirs(app.config['ARCHIVE_DIR'], exist_ok=True)
+            gzip_member = _archive_batch(rows, int(time.time()))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Archive batch failed: {e}")
+            break
+
+        if gzip_member:
+            try:
+                _append_archive_member(gzip_member)
+            except OSError as e:
+                app.logger.error(f"Archive file write failed after committing {len(rows)} posts "
+                                 f"(ids {rows[0][0]}-{rows[-1][0]}): {e}")
+                break
+
+        archived_count += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    if archived_count:
+        app.logger.info(f"Archived {archived_count} completed posts.")
+    return archived_count
+
+def run_db_maintenance(force_vacuum=False):
+    """Refreshes SQLite planner statistics, and reclaims free pages at most every VACUUM_INTERVAL_HOURS."""
+    global _last_vacuum_run
+    if db.engine.dialect.name != 'sqlite':
+        return False
+
+    db.session.commit()
+    vacuum = force_vacuum or time.time() - _last_vacuum_run >= app.config['VACUUM_INTERVAL_HOURS'] * 3600
+    # VACUUM cannot run inside a transaction
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if vacuum:
+            conn.exec_driver_sql('VACUUM')
+            _last_vacuum_run = time.time()
+        conn.exec_driver_sql('ANALYZE')
+    return vacuum
+
+def maybe_run_retention():
+    """Runs archival + maintenance if ARCHIVE_INTERVAL_MINUTES have passed. Called from the worker tick."""
+    global _last_archive_run
+    if time.time() - _last_archive_run < app.config['ARCHIVE_INTERVAL_MINUTES'] * 60:
+        return None
+    _last_archive_run = time.time()
+    try:
+        archived = archive_completed_posts()
+        run_db_maintenance()
+        return archived
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Retention job failed: {e}")
+        return None
+
+
+# --- Worker Queue ---
+
+def claim_due_posts(now_unix):
+    """
+    Picks at most WORKER_MAX_POSTS_PER_TICK due posts and marks them 'processing'.
+    Pages take turns: every page's oldest due post comes before any page's second one, so
+    one page's backlog can't starve the rest, while capacity other pages don't need still
+    goes to the backlogged page. Returns (id, page_id) tuples in processing order.
+    """
+    page_rank = db.func.row_number().over(
+        partition_by=ScheduledPost.page_id,
+        order_by=(ScheduledPost.scheduled_time, ScheduledPost.id)
+    ).label('page_rank')
+    due = db.session.query(
+        ScheduledPost.id, ScheduledPost.page_id, ScheduledPost.scheduled_time, page_rank
+    ).filter(
+        ScheduledPost.status == 'scheduled',
+        ScheduledPost.is_active == True,
+        ScheduledPost.scheduled_time <= now_unix
+    ).subquery()
+
+    candidates = db.session.query(due.c.id, due.c.page_id).order_by(due.c.page_rank, due.c.scheduled_time, due.c.id).limit(app.config['WORKER_MAX_POSTS_PER_TICK']).all()
+
+    # --- CRITICAL FIX: Mark them as 'processing' IMMEDIATELY ---
+    # This prevents the next worker tick (10s later) from grabbing the same posts
+    # while the videos are still uploading. The status guard makes the claim safe
+    # against a concurrent tick that read the same candidates.
+    claimed = []
+    for post_id, page_id in candidates:
+        result = db.session.execute(
+            ScheduledPost.__table__.update()
+            .where(ScheduledPost.id == post_id, ScheduledPost.status == 'scheduled')
+            .values(status='processing')
+        )
+        if result.rowcount:
+            claimed.append((post_id, page_id))
+    db.session.commit()
+    return claimed
+
+
+# --- Graph Batch & Reconciliation ---
+
+GRAPH_API_BATCH_URL = "https://graph.facebook.com/v20.0/"
+GRAPH_BATCH_LIMIT = 50 # Max requests per Graph batch call
+GRAPH_BATCH_TOKEN_ATTEMPTS = 3 # Distinct tokens tried on a batch before falling back to single requests
+
+_last_reconcile_run = 0
+
+def _graph_get_each(lookups):
+    """Fallback for graph_batch_get: one GET per lookup, same result format."""
+    results = []
+    for object_id, fields, token in lookups:
+        try:
+            response = graph_api_request('GET', f"https://graph.facebook.com/v20.0/{object_id}",
+                                         params={'fields': fields, 'access_token': token}, timeout=5)
+            body = response.json()
+            results.append((response.status_code, body if isinstance(body, dict) else {}))
+        except (requests.exceptions.RequestException, ValueError):
+            results.append(None)
+    return results
+
+def _graph_batch_chunk(chunk):
+    """Sends up to GRAPH_BATCH_LIMIT lookups as one batch call. See graph_batch_get."""
+    batch = json.dumps([
+        {'method': 'GET', 'relative_url': f"{object_id}?{urlencode({'fields': fields, 'access_token': token})}"}
+        for object_id, fields, token in chunk
+    ])
+    # The top-level token only authenticates the batch call itself; every item carries its own
+    # page token. If it is rejected (e.g. that page's token expired), retry with the next distinct
+    # token so one broken page doesn't cost the whole chunk its batching.
+    batch_tokens = [app.config['FB_APP_ACCESS_TOKEN']] if app.config['FB_APP_ACCESS_TOKEN'] else []
+    batch_tokens += [token for token in dict.fromkeys(token for _, _, token in chunk) if token not in batch_tokens]
+
+    for token in batch_tokens[:GRAPH_BATCH_TOKEN_ATTEMPTS]:
+        try:
+            response = graph_api_request('POST', GRAPH_API_BATCH_URL, data={
+                'access_token': token,
+                'batch': batch,
+                'include_headers': 'false'
+            }, timeout=30)
+            items = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            app.logger.error(f"Graph batch request failed: {e}")
+            return [None] * len(chunk)
+
+        if isinstance(items, dict) and isinstance(items.get('error'), dict):
+            error = items['error']
+            app.logger.error(f"Graph batch request failed: {error.get('message', 'Unknown API Error')}")
+            if error.get('type') == 'OAuthException' or error.get('code') in (102, 190):
+                continue
+            return [None] * len(chunk)
+        break
+    else:
+        # Every token tried was rejected: last resort, one request per lookup
+        return _graph_get_each(chunk)
+
+    if not isinstance(items, list):
+        app.logger.error("Graph batch request failed: unexpected response format.")
+        return [None] * len(chunk)
+
+    results = []
+    for item in items[:len(chunk)]:
+        if not isinstance(item, dict):
+            results.append(None)
+            continue
+        try:
+            body = json.loads(item.get('body') or '{}')
+        except (TypeError, ValueError):
+            body = None
+        results.append((item.get('code'), body) if isinstance(body, dict) else None)
+    results.extend([None] * (len(chunk) - len(results)))
+    return results
+
+def graph_batch_get(lookups):
+    """
+    Runs GET lookups through Graph batch requests, GRAPH_BATCH_LIMIT per HTTP call.
+    lookups: list of (object_id, fields, access_token). Returns one result per lookup, in order:
+    (http_code, body_dict), or None when no answer came back for it (network error, 5xx, timeout).
+    """
+    results = []
+    for i in range(0, len(lookups), GRAPH_BATCH_LIMIT):
+        results.extend(_graph_batch_chunk(lookups[i:i + GRAPH_BATCH_LIMIT]))
+    return results
+
+def check_tokens_batch(pages):
+    """
+    Batched check_token_and_get_page_info: returns {page.id: {'is_valid', 'page_name'}}.
+    The value is None when Facebook gave no answer for that page, so nothing is known about its token.
+    """
+    # Known-good tokens first, so the token authenticating each batch call is likely to work
+    pages = sorted(pages, key=lambda page: {True: 0, None: 1, False: 2}[page.is_valid])
+    results = graph_batch_get([(page.page_id, 'name', page.access_token) for page in pages])
+    statuses = {}
+    for page, result in zip(pages, results):
+        if result is None:
+            statuses[page.id] = None
+            continue
+        code, body = result
+        if code == 200 and 'name' in body:
+            statuses[page.id] = {'is_valid': True, 'page_name': body['name']}
+        else:
+            error = body.get('error')
+            error_message = error.get('message', 'API Error') if isinstance(error, dict) else 'API Error'
+            statuses[page.id] = {'is_valid': False, 'page_name': f'Error: {error_message}'}
+    return statuses
+
+def store_token_statuses(pages, statuses):
+    """Persists checked statuses; pages without an answer keep their previous result."""
+    now_unix = int(time.time())
+    for page in pages:
+        status = statuses.get(page.id)
+        if status is None:
+            continue
+        page.is_valid = status['is_valid']
+        page.token_error = None if status['is_valid'] else status['page_name'][:255]
+        page.token_checked_at = now_unix
+
+def reconcile_posts(limit):
+    """Checks that posted items still exist on Facebook, least recently checked first."""
+    rows = db.session.query(ScheduledPost.id, ScheduledPost.fb_post_id, Page.access_token, Page.is_valid).join(
+        Page, Page.id == ScheduledPost.page_id
+    ).filter(
+        ScheduledPost.status == 'posted',
+        ScheduledPost.fb_post_id.isnot(None),
+        db.or_(ScheduledPost.fb_exists.is_(None), ScheduledPost.fb_exists == True),
+        Page.is_valid.isnot(False) # A dead token can't tell us anything about its posts
+    ).order_by(ScheduledPost.fb_checked_at.is_(None).desc(), ScheduledPost.fb_checked_at, ScheduledPost.id).limit(limit).all()
+
+    results = graph_batch_get([(fb_post_id, 'id', token) for _, fb_post_id, token, _ in rows])
+    now_unix = int(time.time())
+    updates = []
+    for (post_id, _, _, page_is_valid), result in zip(rows, results):
+        if result is None:
+            continue
+        code, body = result
+        error = body.get('error') if isinstance(body.get('error'), dict) else {}
+        if code == 200:
+            updates.append({'post_id': post_id, 'fb_exists': True, 'fb_checked_at': now_unix})
+        elif error.get('code') == 100 and error.get('error_subcode') == 33 and page_is_valid:
+            # (#100, subcode 33) "does not exist, cannot be loaded due to missing permissions, or does
+            # not support this operation". With a token we just verified, that means the post was deleted.
+            updates.append({'post_id': post_id, 'fb_exists': False, 'fb_checked_at': now_unix})
+        else:
+            # Token or permission problems say nothing about the post itself
+            updates.append({'post_id': post_id, 'fb_exists': None, 'fb_checked_at': now_unix})
+
+    if updates:
+        table = ScheduledPost.__table__
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('post_id')).values(
+                fb_exists=db.bindparam('fb_exists'), fb_checked_at=db.bindparam('fb_checked_at')
+            ),
+            updates
+        )
+    db.session.commit()
+    return sum(1 for u in updates if u['fb_exists'] is False), len(rows)
+
+def reconcile_with_facebook():
+    """Refreshes every page's token validity and a slice of posted items, in batches of 50 lookups."""
+    pages = Page.query.all()
+    statuses = check_tokens_batch(pages)
+    store_token_statuses(pages, statuses)
+    db.session.commit()
+
+    removed, checked = reconcile_posts(app.config['RECONCILE_MAX_POSTS'])
+    invalid = sum(1 for status in statuses.values() if status and not status['is_valid'])
+    app.logger.info(f"Reconciled {len(pages)} pages ({invalid} invalid) and {checked} posts ({removed} removed).")
+    return {'pages_checked': len(pages), 'pages_invalid': invalid, 'posts_checked': checked, 'posts_removed': removed}
+
+def maybe_run_reconciliation():
+    """Runs reconcile_with_facebook if RECONCILE_INTERVAL_MINUTES have passed. Called from the worker tick."""
+    global _last_reconcile_run
+    if time.time() - _last_reconcile_run < app.config['RECONCILE_INTERVAL_MINUTES'] * 60:
+        return None
+    _last_reconcile_run = time.time()
+    try:
+        return reconcile_with_facebook()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Reconciliation failed: {e}")
+        return None
+
+
 # --- Routes ---
 
 @app.route('/')
@@ -298,8 +1486,13 @@ def api_pages():
             access_token=data['token'], # Changed from 'token' to data['token']
             allow_images=True,
             allow_videos=True,
-            time_slots=default_slots
+            time_slots=default_slots,
+            timezone=DEFAULT_TIMEZONE
         )
+        try:
+            apply_page_schedule_settings(new_page, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         try:
             db.session.add(new_page)
             db.session.commit()
@@ -312,15 +1505,26 @@ def api_pages():
     # GET method logic
     try:
         pages = Page.query.all()
+        statuses = check_tokens_batch(pages)
+        store_token_statuses(pages, statuses)
+        db.session.commit()
         page_data = []
         for page in pages:
-            status = check_token_and_get_page_info(page.page_id, page.access_token)
+            status = statuses[page.id]
+            if status is None:
+                # No answer from Facebook this time: report the last known result
+                if page.is_valid is None:
+                    status = {'is_valid': False, 'page_name': 'Connection Timeout/Error'}
+                else:
+                    status = {'is_valid': page.is_valid, 'page_name': page.token_error or page.page_name}
             page_data.append({
                 'id': page.id,
                 'page_name': status['page_name'] if not status['is_valid'] else page.page_name,
                 'page_id': page.page_id,
                 'access_token': page.access_token,
                 'time_slots': page.time_slots,
+                'timezone': page.timezone or DEFAULT_TIMEZONE,
+                'slot_rules': json.loads(page.slot_rules) if page.slot_rules else None,
                 'allow_images': page.allow_images,
                 'allow_videos': page.allow_videos,
                 'is_valid': status['is_valid']
@@ -342,6 +1546,22 @@ def delete_page(page_id):
     db.session.commit()
     return jsonify({'message': 'Page and related schedules deleted successfully'}), 200
 
+@app.route('/api/pages/<int:page_id>/settings', methods=['POST'])
+def update_page_settings(page_id):
+    """Updates a page's timezone, default time slots and per-weekday/blackout slot rules."""
+    page = Page.query.get(page_id)
+    if not page:
+        return jsonify({'error': 'Page not found'}), 404
+
+    try:
+        apply_page_schedule_settings(page, request.get_json() or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+
+    upcoming = slots_between(page, int(time.time()), int(time.time()) + 7 * 86400)
+    return jsonify({'message': 'Page settings updated.', 'next_slots': upcoming[:10]}), 200
+
 # --- API: Folder Management ---
 
 @app.route('/api/folders', methods=['GET', 'POST'])
@@ -408,6 +1628,7 @@ def api_upload_media():
             )
             db.session.add(new_media)
             db.session.commit()
+            queue_media_probe(new_media.id)
             uploaded_files.append({
                 'id': new_media.id,
                 'name': new_media.original_name,
@@ -442,8 +1663,16 @@ def api_media():
         data.append({
             'id': media.id,
             'name': media.original_name,
-            'type': media.file_type,
-            'filename': media.filename
+            'type': media.mime_type or media.file_type,
+            'filename': media.filename,
+            'probe_status': media.probe_status,
+            'size': media.file_size,
+            'width': media.width,
+            'height': media.height,
+            'duration': media.duration_seconds,
+            'checksum': media.checksum,
+            'needs_transcode': media.needs_transcode,
+            'probe_error': media.probe_error
         })
     return jsonify(data)
 
@@ -483,30 +1712,46 @@ def api_schedule_automation():
     if not media_files or not target_pages:
         return jsonify({'error': 'Selected media or pages not found.'}), 404
 
-    scheduled_count = 0
-    
-    last_scheduled_time = datetime.datetime.now()
-    
-    post_queue = []
-    for media in media_files:
-        for page in target_pages:
-            is_video = 'video' in media.file_type.lower()
-            if is_video and not page.allow_videos:
-                continue
-            if not is_video and not page.allow_images:
-                continue
-            post_queue.append((page, media))
-            
-    if not post_queue:
-        return jsonify({'message': 'No posts were scheduled. Check page content restrictions against selected media types.'}), 200
+    # Don't book slots for media the worker would reject anyway
+    rejected = [
+        {'media_id': media.id, 'media_name': media.original_name, 'reason': media_rejection_reason(media)}
+        for media in media_files if media_rejection_reason(media)
+    ]
+    media_files = [media for media in media_files if not media_rejection_reason(media)]
 
+    strategy = data.get('strategy', 'round_robin')
+    if strategy not in ('round_robin', 'even'):
+        return jsonify({'error': 'strategy must be "round_robin" or "even".'}), 400
+    try:
+        horizon_days = int(str(data.get('horizonDays', PLANNER_HORIZON_DAYS)).strip())
+    except ValueError:
+        horizon_days = 0
+    if horizon_days <= 0:
+        return jsonify({'error': 'horizonDays must be a positive whole number of days.'}), 400
+    horizon_days = min(horizon_days, SLOT_CALENDAR_DAYS)
+    dry_run = bool(data.get('dryRun', False))
 
-    for page, media in post_queue:
-        next_slot = get_next_available_slot(page.id, page.time_slots, last_scheduled_time)
-        
-        if not next_slot:
-            break
+    plan, unscheduled = plan_campaign(media_files, target_pages, strategy=strategy, horizon_days=horizon_days)
 
+    if not plan and not unscheduled:
+        return jsonify({'message': 'No posts were scheduled. Check page content restrictions against selected media types.'}), 200
+
+    if dry_run:
+        return jsonify({
+            'message': f'Preview: {len(plan)} posts across {len(target_pages)} pages, {len(unscheduled)} without a free slot.',
+            'dry_run': True,
+            'schedule': [{
+                'page_id': page.id,
+                'page_name': page.page_name,
+                'media_id': media.id,
+                'media_name': media.original_name,
+                'scheduled_time': int(slot.timestamp())
+            } for page, media, slot in plan],
+            'unscheduled': unscheduled,
+            'rejected': rejected
+        }), 200
+
+    for page, media, slot in plan:
         title, description = generate_post_content(title_template, description_template)
 
         new_post = ScheduledPost(
@@ -514,17 +1759,53 @@ def api_schedule_automation():
             media_file_id=media.id,
             title=title,
             description=description,
-            scheduled_time=int(next_slot.timestamp()),
-            media_type='video' if 'video' in media.file_type.lower() else 'image',
+            scheduled_time=int(slot.timestamp()),
+            media_type='video' if media_is_video(media) else 'image',
             is_active=True # Posts are active by default
         )
-        
         db.session.add(new_post)
-        last_scheduled_time = next_slot
-        scheduled_count += 1
-        
+
     db.session.commit()
-    return jsonify({'message': f'{scheduled_count} unique posts have been scheduled across {len(target_pages)} pages.'}), 201
+    message = f'{len(plan)} unique posts have been scheduled across {len(target_pages)} pages.'
+    if unscheduled:
+        message += f' {len(unscheduled)} could not fit within {horizon_days} days.'
+    if rejected:
+        message += f' {len(rejected)} media rejected by validation.'
+    return jsonify({'message': message, 'unscheduled': unscheduled, 'rejected': rejected}), 201
+
+@app.route('/api/schedule/import', methods=['POST'])
+def api_schedule_import():
+    """
+    Bulk import from an uploaded 'file' (multipart) or a raw request body.
+    Format comes from ?format=jsonl|csv, else the file extension, else JSONL. ?dryRun=1 only validates.
+    """
+    upload = request.files.get('file')
+    filename = (upload.filename or '') if upload else ''
+    fmt = request.args.get('format') or ('csv' if filename.lower().endswith('.csv') else 'jsonl')
+    if fmt not in ('jsonl', 'csv'):
+        return jsonify({'error': 'format must be "jsonl" or "csv".'}), 400
+
+    try:
+        if upload:
+            # Werkzeug spools uploads into a SpooledTemporaryFile, which TextIOWrapper can't wrap
+            # before Python 3.11 (no readable()). Copy it to a real temp file in chunks instead.
+            with tempfile.TemporaryFile() as spool:
+                shutil.copyfileobj(upload.stream, spool)
+                spool.seek(0)
+                summary = import_scheduled_posts(spool, fmt, dry_run=request.args.get('dryRun') == '1')
+        else:
+            summary = import_scheduled_posts(request.stream, fmt, dry_run=request.args.get('dryRun') == '1')
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Bulk import failed: {e}")
+        return jsonify({'error': 'Import aborted by an internal error. Check server logs for details.'}), 500
+
+    verb = 'validated' if summary['dry_run'] else 'imported'
+    summary['message'] = f"{summary['imported_count']} posts {verb}, {summary['error_count']} rows rejected."
+    if summary['aborted']:
+        summary['error'] = summary['aborted']
+        return jsonify(summary), 500
+    return jsonify(summary), 200 if summary['dry_run'] else 201
 
 @app.route('/api/schedule_now', methods=['POST'])
 def api_schedule_now():
@@ -548,7 +1829,11 @@ def api_schedule_now():
 
     for page in target_pages:
         for media in media_files:
-            is_video = 'video' in media.file_type.lower()
+            reason = media_rejection_reason(media)
+            if reason:
+                failure_details.append(f"{media.original_name}: Rejected - {reason}")
+                continue
+            is_video = media_is_video(media)
             if is_video and not page.allow_videos:
                 failure_details.append(f"Page {page.page_name}: Videos restricted.")
                 continue
@@ -624,67 +1909,6 @@ def delete_folder(folder_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def get_next_available_slot(page_id, time_slots_str, start_dt):
-    """Finds the next unique time slot for scheduling."""
-    time_slots = sorted([ts.strip() for ts in time_slots_str.split(',') if ts.strip()])
-    if not time_slots: return None
-    
-    # Parse slots into hour/minute tuples for comparison
-    parsed_slots = []
-    for ts in time_slots:
-        try:
-            h, m = map(int, ts.split(':'))
-            parsed_slots.append((h, m))
-        except:
-            continue
-            
-    if not parsed_slots: return None
-    
-    # Start searching
-    current_dt = start_dt + timedelta(minutes=1)
-    current_dt = current_dt.replace(second=0, microsecond=0)
-    
-    # Limit search to 60 days (handles 170+ posts easily)
-    search_limit = current_dt + timedelta(days=60)
-    
-    while current_dt < search_limit:
-        # Current time components
-        c_h, c_m = current_dt.hour, current_dt.minute
-        
-        # Check if current time is a valid slot
-        is_slot = False
-        for h, m in parsed_slots:
-            if c_h == h and c_m == m:
-                is_slot = True
-                break
-        
-        if is_slot:
-            scheduled_unix = int(current_dt.timestamp())
-            existing_post = ScheduledPost.query.filter(
-                ScheduledPost.page_id == page_id,
-                ScheduledPost.scheduled_time == scheduled_unix,
-                ScheduledPost.status != 'failed'
-            ).first()
-
-            if not existing_post:
-                return current_dt
-
-        # --- OPTIMIZATION & FIX ---
-        # If we are past the last slot of the day, jump to the first slot of TOMORROW.
-        last_h, last_m = parsed_slots[-1]
-        if (c_h > last_h) or (c_h == last_h and c_m >= last_m):
-            # Jump to tomorrow first slot
-            first_h, first_m = parsed_slots[0]
-            # Use timedelta to safely add a day (Fixes "day out of range" error)
-            current_dt = current_dt + timedelta(days=1)
-            current_dt = current_dt.replace(hour=first_h, minute=first_m)
-        else:
-            # Otherwise just check next minute (or could jump to next slot, but minute safe)
-            current_dt += timedelta(minutes=1)
-            
-    return None
-
-
 @app.route('/api/schedule', methods=['GET'])
 def api_schedule():
     posts = ScheduledPost.query.all()
@@ -706,6 +1930,7 @@ def api_schedule():
             'status': post.status,
             'is_active': post.is_active,
             'fb_post_id': post.fb_post_id,
+            'fb_exists': post.fb_exists,
             'error_message': post.error_message
         })
         
@@ -720,43 +1945,93 @@ def api_worker_run():
     Prevents double-posting by marking items as 'processing' immediately.
     """
     now_unix = int(time.time())
+
+    # Pick up media that was never probed (older uploads, or probes lost on restart)
+    probe_pending_media()
     
-    # 1. Find posts that are ready
-    posts_to_process = ScheduledPost.query.filter(
-        ScheduledPost.status == 'scheduled',
-        ScheduledPost.is_active == True,
-        ScheduledPost.scheduled_time <= now_unix
-    ).all()
+    # 1. Find posts that are ready, as (id, page_id) tuples only
+    due_posts = claim_due_posts(now_unix)
     
-    if not posts_to_process:
+    if not due_posts:
+        # Idle tick: keep the live table small and refresh token/post state.
+        # Both are no-ops unless ARCHIVE_INTERVAL_MINUTES / RECONCILE_INTERVAL_MINUTES have passed.
+        maybe_run_retention()
+        maybe_run_reconciliation()
         # app.logger.info('Worker ran: No active posts due for execution.') # Optional: Silence logs
         return jsonify({'message': 'Worker ran: No active posts due for execution.'}), 200
 
-    # --- CRITICAL FIX: Mark them as 'processing' IMMEDIATELY ---
-    # This prevents the next worker tick (10s later) from grabbing the same posts
-    # while the videos are still uploading.
-    for post in posts_to_process:
-        post.status = 'processing'
-    db.session.commit()
-    # -----------------------------------------------------------
-
     processed_count = 0
     failed_count = 0
+    chunk_size = app.config['WORKER_CHUNK_SIZE']
     
-    for post in posts_to_process:
-        # We pass publish_now=True because the worker has already determined it's time.
-        success, result = post_to_facebook(post.id, publish_now=True)
-        if success:
-            processed_count += 1
-        else:
-            failed_count += 1
-            
-    # Commit final results (status='posted' or 'failed' is set inside post_to_facebook)
-    db.session.commit()
+    for i in range(0, len(due_posts), chunk_size):
+        for post_id, _ in due_posts[i:i + chunk_size]:
+            # We pass publish_now=True because the worker has already determined it's time.
+            success, result = post_to_facebook(post_id, publish_now=True)
+            if success:
+                processed_count += 1
+            else:
+                failed_count += 1
+        # Commit final results (status='posted' or 'failed' is set inside post_to_facebook)
+        # and drop the chunk's Post/Page/Media objects before loading the next one.
+        db.session.commit()
+        db.session.expunge_all()
     
-    message = f"Worker ran: {processed_count} posts sent, {failed_count} failures."
+    remaining = db.session.query(db.func.count(ScheduledPost.id)).filter(
+        ScheduledPost.status == 'scheduled',
+        ScheduledPost.is_active == True,
+        ScheduledPost.scheduled_time <= now_unix
+    ).scalar()
+    # Maintenance (archive, ANALYZE, VACUUM) and Graph reconciliation never run ahead of
+    # publishing, and wait out a backlog
+    if not remaining:
+        maybe_run_retention()
+        maybe_run_reconciliation()
+    message = f"Worker ran: {processed_count} posts sent, {failed_count} failures, {remaining} still due."
     app.logger.info(message)
-    return jsonify({'message': message, 'success_count': processed_count, 'failed_count': failed_count}), 200
+    return jsonify({'message': message, 'success_count': processed_count, 'failed_count': failed_count, 'remaining_count': remaining}), 200
+
+@app.route('/api/maintenance/archive', methods=['POST'])
+def api_maintenance_archive():
+    """Runs the retention job immediately (archive + ANALYZE, VACUUM when ?vacuum=1)."""
+    try:
+        archived = archive_completed_posts()
+        vacuumed = run_db_maintenance(force_vacuum=request.args.get('vacuum') == '1')
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'message': f'{archived} posts archived.', 'archived_count': archived, 'vacuumed': vacuumed}), 200
+
+@app.route('/api/maintenance/reconcile', methods=['POST'])
+def api_maintenance_reconcile():
+    """Runs the Facebook reconciliation job immediately."""
+    try:
+        summary = reconcile_with_facebook()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    summary['message'] = (f"{summary['pages_checked']} pages checked ({summary['pages_invalid']} invalid), "
+                          f"{summary['posts_checked']} posts checked ({summary['posts_removed']} removed).")
+    return jsonify(summary), 200
+
+@app.route('/api/stats/daily', methods=['GET'])
+def api_stats_daily():
+    """Returns archived per page/day counters. Optional ?pageId= and ?days= filters."""
+    query = PostDailyStats.query
+    page_id = request.args.get('pageId', type=int)
+    if page_id:
+        query = query.filter(PostDailyStats.page_id == page_id)
+    days = request.args.get('days', type=int)
+    if days:
+        since = (datetime.date.today() - timedelta(days=days)).strftime('%Y-%m-%d')
+        query = query.filter(PostDailyStats.day >= since)
+
+    return jsonify([{
+        'page_id': st.page_id,
+        'day': st.day,
+        'posted_count': st.posted_count,
+        'failed_count': st.failed_count
+    } for st in query.order_by(PostDailyStats.day.desc(), PostDailyStats.page_id).all()])
 
 @app.route('/api/schedule/edit_time/<int:post_id>', methods=['POST'])
 def api_schedule_edit_time(post_id):
@@ -0,0 +1,96 @@
+"""Unit checks for the header parsers behind the media probe pipeline."""
+import io
+import struct
+
+from app import _image_dimensions, _mp4_metadata, _sniff_mime_type
+
+
+def box(box_type, payload):
+    return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+
+def ftyp(major, compatible=b'isom'):
+    return box(b'ftyp', major + b'\x00\x00\x00\x00' + compatible)
+
+
+def jpeg(width, height):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + b'\x00' * 9
+    # A DHT segment before the frame header must be skipped, not read as SOF
+    dht = b'\xff\xc4' + struct.pack('>H', 5) + b'\x00\x00\x00'
+    sof0 = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, height, width, 3) + b'\x00' * 6
+    return b'\xff\xd8' + app0 + dht + sof0 + b'\xff\xd9'
+
+
+def tiff(order, width_type):
+    fmt = '<' if order == b'II' else '>'
+    magic = b'II*\x00' if order == b'II' else b'MM\x00*'
+    entries = [(256, width_type, 640), (257, 4, 480), (259, 3, 1)]
+    ifd = struct.pack(fmt + 'H', len(entries))
+    for tag, field_type, value in entries:
+        packed = struct.pack(fmt + 'H', value) + b'\x00\x00' if field_type == 3 else struct.pack(fmt + 'I', value)
+        ifd += struct.pack(fmt + 'HHI', tag, field_type, 1) + packed
+    return magic + struct.pack(fmt + 'I', 8) + ifd + struct.pack(fmt + 'I', 0)
+
+
+def mp4(duration_ms, width, height, version=0):
+    if version == 1:
+        mvhd = box(b'mvhd', b'\x01' + b'\x00' * 3 + b'\x00' * 16 + struct.pack('>IQ', 1000, duration_ms) + b'\x00' * 80)
+    else:
+        mvhd = box(b'mvhd', b'\x00' * 4 + b'\x00' * 8 + struct.pack('>II', 1000, duration_ms) + b'\x00' * 80)
+    tkhd = box(b'tkhd', b'\x00' * 76 + struct.pack('>II', width << 16, height << 16))
+    return ftyp(b'isom') + box(b'moov', mvhd + box(b'trak', tkhd))
+
+
+def test_sniff_images():
+    assert _sniff_mime_type(jpeg(1, 1)[:32]) == 'image/jpeg'
+    assert _sniff_mime_type(b'\x89PNG\r\n\x1a\n' + b'\x00' * 24) == 'image/png'
+    assert _sniff_mime_type(b'GIF89a' + b'\x00' * 26) == 'image/gif'
+    assert _sniff_mime_type(tiff(b'II', 3)[:32]) == 'image/tiff'
+    assert _sniff_mime_type(tiff(b'MM', 3)[:32]) == 'image/tiff'
+    assert _sniff_mime_type(b'RIFF\x00\x00\x00\x00WEBPVP8 ') == 'image/webp'
+
+
+def test_sniff_iso_bmff_brands():
+    assert _sniff_mime_type(ftyp(b'isom')) == 'video/mp4'
+    assert _sniff_mime_type(ftyp(b'mp42')) == 'video/mp4'
+    assert _sniff_mime_type(ftyp(b'qt  ')) == 'video/quicktime'
+    # HEIF/AVIF stills and M4A audio share the container but must not be routed as video
+    assert _sniff_mime_type(ftyp(b'heic')) == 'image/heic'
+    assert _sniff_mime_type(ftyp(b'mif1', b'heic')) == 'image/heic'
+    assert _sniff_mime_type(ftyp(b'avif')) == 'image/avif'
+    assert _sniff_mime_type(ftyp(b'mif1', b'avif')) == 'image/avif'
+    assert _sniff_mime_type(ftyp(b'M4A ')) == 'audio/mp4'
+
+
+def test_sniff_unknown():
+    assert _sniff_mime_type(b'garbage' * 4) is None
+    assert _sniff_mime_type(b'') is None
+
+
+def test_jpeg_dimensions():
+    assert _image_dimensions(io.BytesIO(jpeg(400, 300)), 'image/jpeg') == (400, 300)
+
+
+def test_jpeg_without_frame_header():
+    assert _image_dimensions(io.BytesIO(b'\xff\xd8\xff\xd9'), 'image/jpeg') is None
+
+
+def test_tiff_dimensions_both_byte_orders():
+    for order in (b'II', b'MM'):
+        for width_type in (3, 4):
+            assert _image_dimensions(io.BytesIO(tiff(order, width_type)), 'image/tiff') == (640, 480)
+
+
+def test_mp4_metadata():
+    data = mp4(12500, 1280, 720)
+    assert _mp4_metadata(io.BytesIO(data), len(data)) == (12.5, 1280, 720)
+
+
+def test_mp4_metadata_version1_mvhd():
+    data = mp4(90000, 1920, 1080, version=1)
+    assert _mp4_metadata(io.BytesIO(data), len(data)) == (90.0, 1920, 1080)
+
+
+def test_mp4_without_moov():
+    data = ftyp(b'isom')
+    assert _mp4_metadata(io.BytesIO(data), len(data)) == (None, None, None)